@@ -1,9 +1,15 @@
+import os
 import re
+import time
+import hashlib
+import heapq
+import itertools
+import threading
 import requests
 import json
 import base64
 from pathlib import Path
-from typing import Union, List, Tuple
+from typing import Union, List, Tuple, Dict
 
 
 def npj(v: dict):
@@ -35,6 +41,50 @@ def is_sha(_input: str) -> bool:
     return len(_input) == 40 and re.findall("[0-9a-z]{40}", _input)
 
 
+def is_under(path: str, parent: str) -> bool:
+    """
+    Check if path is the parent itself or somewhere inside it e.g. ("test/test.json", "test") -> True
+    """
+    return parent == "." or path == parent or path.startswith(parent + "/")
+
+
+def blob_sha(data: bytes) -> str:
+    """
+    Calculates the sha git gives a file with this content, without asking github
+    """
+    return hashlib.sha1(b"blob %d\0" % len(data) + data).hexdigest()
+
+
+def is_rate_limited(response: requests.Response) -> bool:
+    """
+    429 is always a rate limit, 403 only if github says so, otherwise its a permission error
+    """
+    if response.status_code == 429:
+        return True
+    if response.status_code != 403:
+        return False
+    return "Retry-After" in response.headers or \
+        response.headers.get("X-RateLimit-Remaining") == "0" or \
+        "rate limit" in response.text.lower()
+
+
+class GithubError(Exception):
+    def __init__(self, response: requests.Response, permanent: bool = None):
+        """
+        Raised when github answers an api call with an error
+        .response -> the failed requests.Response
+        .permanent -> True if sending the same thing again will never work
+        :param response: The failed response
+        :param permanent: Defaults to True for 4xx errors that aren't rate limits, timeouts or conflicts
+        """
+        self.response = response
+        if permanent is None:
+            permanent = 400 <= response.status_code < 500 and response.status_code not in [408, 409] and \
+                not is_rate_limited(response)
+        self.permanent = permanent
+        super().__init__(f"{response.request.method} {response.url} -> {response.status_code}: {response.text}")
+
+
 class Child:
     def __init__(self, info, base):
         """
@@ -100,19 +150,21 @@ class Child:
 
 
 class Response:
-    def __init__(self, info: dict, headers: dict, base):
+    def __init__(self, info: dict, headers: dict, base, content: str = None):
         """
         A class used in Database.get() function, it has several informative
         functions such as: content, json, text, remove, type, children, to_dict
         :param info: Information of blob/tree fetched from the api
         :param headers: Headers to be used in api call {"Authorization": "token ..."}
         :param base: The Database, used in Response.remove()
+        :param content: Base64 content if already known e.g. a write that is still in the journal,
+        None means it wasn't fetched yet ("" is an empty file)
         """
         self.__info = info
         self.__headers = headers
-        self.__base64 = ""
+        self.__base64 = content
         self.__base = base
-        self.__children = []
+        self.__children = None
 
     def remove(self):
         """
@@ -165,13 +217,13 @@ class Response:
         """
         Retrieves the base64 information from github
         """
-        self.__base64 = requests.get(self.__info["url"], headers=self.__headers).json()["content"]
+        self.__base64 = self.__base._url_req(self.__info["url"]).json()["content"]
 
     def __check_for_base64(self):
         """
         Fetches base64 content if not already has
         """
-        if not self.__base64:
+        if self.__base64 is None:
             self.__get_base64()
 
     def __check_for_children(self):
@@ -180,13 +232,15 @@ class Response:
         WE CACHED CHILDREN OF THIS DIRECTORY JUST MAYBE
         """
         # Fetch if not fetched
-        if not self.__children:
-            self.__children = requests.get(self.__info["url"], headers=self.__headers).json()['tree']
+        if self.__children is None:
+            # A directory that only exists in the journal has nothing on github yet
+            self.__children = self.__base._url_req(self.__info["url"]).json()['tree'] if self.__info["url"] else []
             for i, ch in enumerate(self.__children):
                 # It returns paths in local scope e.g. if response's path is test/test2
                 # and you fetch children, raw data is file.json instead of test/test2/file.json
                 # So well just fix it by adding the two paths and turning it from file\\file.txt to file/file.txt
                 self.__children[i]['path'] = str(Path(self.__info['path']) / ch['path']).replace("\\", "/")
+            self.__children = self.__base._overlay_children(self.path, self.__children)
 
     def __is_tree(self) -> bool:
         """
@@ -236,14 +290,364 @@ class Response:
         return [Child(x, self.__base) for x in self.__children] if self.__is_tree() else None
 
 
+class _Flight:
+    def __init__(self, priority: int):
+        """
+        A private class used by RequestScheduler to hand the result of one
+        in-flight GET to every thread that asked for the same thing
+        :param priority: The most urgent priority of everyone waiting on it
+        """
+        self.priority = priority
+        # [priority, ticket] while queued for a token, so the priority can be raised in place
+        self.entry = None
+        self.done = threading.Event()
+        self.response = None
+        self.error = None
+
+
+class RequestScheduler:
+    # Priority classes, lower goes first
+    INTERACTIVE = 0
+    BACKGROUND = 1
+
+    def __init__(self, max_retries: int = 5, base_delay: float = 1.0, max_delay: float = 60.0):
+        """
+        Sits in front of every api call and keeps us inside github's rate limits
+        main functions are
+        .request() -> sends a request once a token is available
+        The token bucket is refilled from X-RateLimit-Remaining / X-RateLimit-Reset,
+        403/429 rate limit responses are retried with exponential backoff (or Retry-After),
+        and identical GETs that are already in flight are only sent once
+        :param max_retries: How many times a rate limited request is retried before giving up
+        :param base_delay: First backoff delay in seconds, doubled on every retry
+        :param max_delay: Upper limit of a single backoff delay in seconds
+        """
+        self._max_retries = max_retries
+        self._base_delay = base_delay
+        self._max_delay = max_delay
+        self.__cond = threading.Condition()
+        # None means we don't know yet, so don't hold anything back
+        self.__remaining = None
+        self.__reset = 0.0
+        # Set after a rate limited response, nothing is sent before this time
+        self.__blocked_until = 0.0
+        # Heap of [priority, ticket] waiting for a token
+        self.__waiting = []
+        self.__tickets = itertools.count()
+        self.__in_flight: Dict[tuple, _Flight] = {}
+
+    def request(self, method: str, url: str, body: dict = None, headers: dict = None,
+                priority: int = INTERACTIVE) -> requests.Response:
+        """
+        Calls a request once the rate limit allows it
+        :param method: The method of request ["get", "post"]
+        :param url: Full url of the request
+        :param body: Body of the request if not get method
+        :param headers: Headers to be used in api call {"Authorization": "token ..."}
+        :param priority: RequestScheduler.INTERACTIVE or RequestScheduler.BACKGROUND
+        :return: requests.Response class
+        """
+        method = method.upper()
+        if method != "GET" or body is not None:
+            return self.__send(method, url, body, headers, _Flight(priority))
+
+        # Single flight, whoever asks first does the call and the rest wait for its response
+        key = (url, tuple(sorted((headers or {}).items())))
+        with self.__cond:
+            flight = self.__in_flight.get(key)
+            leader = flight is None
+            if leader:
+                flight = self.__in_flight[key] = _Flight(priority)
+            elif priority < flight.priority:
+                # Don't let an interactive caller wait behind a background leader
+                self.__raise_priority(flight, priority)
+
+        if not leader:
+            flight.done.wait()
+            if flight.error is not None:
+                raise flight.error
+            return flight.response
+
+        try:
+            flight.response = self.__send(method, url, body, headers, flight)
+        except Exception as e:
+            flight.error = e
+            raise
+        finally:
+            with self.__cond:
+                del self.__in_flight[key]
+            flight.done.set()
+        return flight.response
+
+    def __send(self, method: str, url: str, body: Union[dict, None], headers: Union[dict, None],
+               flight: _Flight) -> requests.Response:
+        """
+        Sends the request, retrying it while github says we are rate limited
+        """
+        attempt = 0
+        while True:
+            self.__acquire(flight)
+            response = requests.request(method, url, json=body, headers=headers)
+            delay = self.__update(response, attempt)
+            if delay is None or attempt >= self._max_retries:
+                return response
+            attempt += 1
+
+    def __acquire(self, flight: _Flight):
+        """
+        Blocks until it's this request's turn and a token is available
+        """
+        with self.__cond:
+            entry = flight.entry = [flight.priority, next(self.__tickets)]
+            heapq.heappush(self.__waiting, entry)
+            while True:
+                wait = self.__time_until_token()
+                if self.__waiting[0] is entry and wait <= 0:
+                    break
+                self.__cond.wait(wait if wait > 0 else None)
+            heapq.heappop(self.__waiting)
+            flight.entry = None
+            if self.__remaining is not None:
+                self.__remaining -= 1
+            # Let the next in line check for a token
+            self.__cond.notify_all()
+
+    def __raise_priority(self, flight: _Flight, priority: int):
+        """
+        Moves a flight up to the given priority, even if it's already queued, must hold self.__cond
+        """
+        flight.priority = priority
+        if flight.entry is not None:
+            flight.entry[0] = priority
+            heapq.heapify(self.__waiting)
+            self.__cond.notify_all()
+
+    def __time_until_token(self) -> float:
+        """
+        Seconds until a request may be sent, 0 or less if one can go now
+        """
+        now = time.time()
+        if self.__blocked_until > now:
+            return self.__blocked_until - now
+        if self.__remaining is not None and self.__remaining <= 0:
+            if self.__reset > now:
+                return self.__reset - now
+            # Window reset, the next response will tell us the new budget
+            self.__remaining = None
+        return 0
+
+    def __update(self, response: requests.Response, attempt: int) -> Union[float, None]:
+        """
+        Refills the bucket from the response headers and returns the backoff delay
+        if the response was rate limited otherwise None
+        """
+        headers = response.headers
+        with self.__cond:
+            if "X-RateLimit-Remaining" in headers:
+                self.__remaining = int(headers["X-RateLimit-Remaining"])
+            if "X-RateLimit-Reset" in headers:
+                self.__reset = float(headers["X-RateLimit-Reset"])
+
+            if not is_rate_limited(response):
+                self.__cond.notify_all()
+                return None
+
+            retry_after = headers.get("Retry-After")
+            if retry_after is not None and retry_after.isdigit():
+                delay = float(retry_after)
+            elif self.__remaining == 0 and self.__reset > time.time():
+                delay = self.__reset - time.time()
+            else:
+                delay = min(self._base_delay * 2 ** attempt, self._max_delay)
+            # Rate limits are per token, so everyone waits, not just this request
+            self.__blocked_until = max(self.__blocked_until, time.time() + delay)
+            self.__cond.notify_all()
+            return delay
+
+
+
+class Journal:
+    def __init__(self, path: str):
+        """
+        A local append-only file of writes that weren't pushed to github yet,
+        one json entry per line, used by Database when a journal path is given
+        main functions are
+        .append() -> writes an entry and fsyncs it before returning
+        .lookup() -> what the pending entries say about a path
+        .overlay() -> applies pending entries to a directory's children
+        .pending() -> every pending entry in order
+        .changes() -> pending entries boiled down to the last word on every path
+        .truncate() -> forgets entries that made it to github
+        :param path: Path of the journal file, entries found in it are loaded so they can be replayed
+        """
+        self._path = Path(path)
+        self.__lock = threading.Lock()
+        self.__entries = self.__load()
+        self.__seq = self.__entries[-1]["seq"] if self.__entries else 0
+        self.__file = open(self._path, "a", encoding="utf-8")
+
+    def __load(self) -> List[dict]:
+        """
+        Reads entries left over from last run
+        """
+        if not self._path.exists():
+            return []
+        lines = self._path.read_text(encoding="utf-8").splitlines()
+        entries = []
+        for line in lines:
+            try:
+                entries.append(json.loads(line))
+            except ValueError:
+                # A write cut off by a crash, set() never returned for it so just drop it
+                break
+        if len(entries) != len(lines):
+            # Rewrite without the broken line so new entries don't get glued to it
+            self.__rewrite(entries)
+        return entries
+
+    def __rewrite(self, entries: List[dict]):
+        """
+        Atomically replaces the journal file with the given entries
+        """
+        tmp = self._path.with_name(self._path.name + ".tmp")
+        with open(tmp, "w", encoding="utf-8") as f:
+            f.writelines(json.dumps(x) + "\n" for x in entries)
+            f.flush()
+            os.fsync(f.fileno())
+        os.replace(tmp, self._path)
+
+    def append(self, op: str, path: str, content: str = None) -> dict:
+        """
+        Adds an entry, it's on disk once this returns
+        :param op: "set" or "remove"
+        :param path: The path of the file/directory
+        :param content: Base64 content of the file if op is "set"
+        :return: The entry
+        """
+        with self.__lock:
+            self.__seq += 1
+            entry = {"seq": self.__seq, "op": op, "path": path}
+            if content is not None:
+                entry["content"] = content
+            self.__file.write(json.dumps(entry) + "\n")
+            self.__file.flush()
+            os.fsync(self.__file.fileno())
+            self.__entries.append(entry)
+            return entry
+
+    @staticmethod
+    def collapse(entries: List[dict]) -> Dict[str, dict]:
+        """
+        Keeps only the last word on every path, a removal also cancels older writes inside it,
+        so every "set" left is newer than any "remove" covering it
+        :param entries: Entries in the order they were written
+        :return: {path: entry}
+        """
+        changes = {}
+        for entry in entries:
+            if entry["op"] == "remove":
+                for _path in [x for x in changes if is_under(x, entry["path"])]:
+                    del changes[_path]
+            changes[entry["path"]] = entry
+        return changes
+
+    def changes(self) -> Tuple[Dict[str, dict], int]:
+        """
+        Returns the collapsed pending entries and the seq of the last one, 0 if there are none
+        """
+        entries = self.pending()
+        return self.collapse(entries), entries[-1]["seq"] if entries else 0
+
+    @staticmethod
+    def blob_info(entry: dict) -> dict:
+        """
+        Builds the same info github gives for a blob out of a pending "set" entry
+        """
+        _data = base64.b64decode(entry["content"])
+        return {
+            "path": entry["path"],
+            "mode": "100644",
+            "type": "blob",
+            "size": len(_data),
+            "sha": blob_sha(_data),
+            "url": None
+        }
+
+    def lookup(self, path: str) -> Union[dict, None]:
+        """
+        Returns the pending "set" entry if path is a pending file, {"op": "tree", "path": path}
+        if files are pending inside it, the "remove" entry if it's pending removal, otherwise None
+        """
+        changes, _ = self.changes()
+        if path in changes and changes[path]["op"] == "set":
+            return changes[path]
+        if any(entry["op"] == "set" and is_under(_path, path) for _path, entry in changes.items()):
+            return {"op": "tree", "path": path}
+        return next((entry for _path, entry in changes.items()
+                     if entry["op"] == "remove" and is_under(path, _path)), None)
+
+    def overlay(self, path: str, children: List[dict]) -> List[dict]:
+        """
+        Applies pending entries to the direct children of a directory
+        :param path: The path of the directory
+        :param children: Info of the children github knows about
+        :return: Info of the children including pending writes and without pending removals
+        """
+        changes, _ = self.changes()
+        removed = [_path for _path, entry in changes.items() if entry["op"] == "remove"]
+        out = {x["path"]: x for x in children if not any(is_under(x["path"], r) for r in removed)}
+        for _path, entry in changes.items():
+            if entry["op"] != "set" or _path == path or not is_under(_path, path):
+                continue
+            # e.g. path "a", pending "a/b/c.txt" -> child "a/b"
+            name = (_path if path == "." else _path[len(path) + 1:]).split("/")[0]
+            child = name if path == "." else f"{path}/{name}"
+            if child == _path:
+                out[child] = self.blob_info(entry)
+            elif child not in out:
+                out[child] = {"path": child, "mode": "040000", "type": "tree", "sha": None, "url": None}
+        return list(out.values())
+
+    def pending(self) -> List[dict]:
+        """
+        Returns a copy of every entry not yet on github
+        """
+        with self.__lock:
+            return list(self.__entries)
+
+    def truncate(self, seq: int):
+        """
+        Forgets every entry up to and including seq, entries appended meanwhile are kept
+        """
+        with self.__lock:
+            self.__entries = [x for x in self.__entries if x["seq"] > seq]
+            self.__file.close()
+            self.__rewrite(self.__entries)
+            self.__file = open(self._path, "a", encoding="utf-8")
+
+    def close(self):
+        with self.__lock:
+            self.__file.close()
+
+
 class Database:
-    def __init__(self, token: str, name: str):
+    def __init__(self, token: str, name: str, scheduler: RequestScheduler = None, journal: str = None,
+                 flush_interval: float = 1.0, max_flush_delay: float = 60.0):
         """
         Declares a Github Database variable
         :param token: Github user token
         :param name: The name of the repo that
         will/is going to store the data. If it
         was not found it will create a private repo
+        :param scheduler: RequestScheduler to send api calls through, pass the same one
+        to every Database using the same token so they share the rate limit
+        :param journal: Path of a local journal file, if given set() and remove() only write
+        to it and return, a background thread pushes them to github in batched commits.
+        Anything left in it from a crash gets pushed on start
+        :param flush_interval: Seconds between pushes of the journal
+        :param max_flush_delay: Upper limit of the backoff between failed pushes in seconds.
+        If github rejects a push for good the background thread stops and keeps the GithubError
+        in .flush_error, set() and remove() raise it until a flush() goes through
         :rtype: Database
         """
 
@@ -251,6 +655,7 @@ class Database:
         self._name = name
         self.__cache = {}
         self._api = "https://api.github.com"
+        self._scheduler = scheduler if scheduler is not None else RequestScheduler()
 
         # Get user info
         self._info = self._api_req("/user").json()
@@ -269,16 +674,41 @@ class Database:
             self._name = self._repo["name"]
 
         self._update_all_sha()
-
-    def _update_all_sha(self):
+        self._update_head()
+
+        self.__journal = None
+        self.flush_error = None
+        if journal is not None:
+            self.__journal = Journal(journal)
+            self.__flush_interval = flush_interval
+            self.__max_flush_delay = max_flush_delay
+            self.__flush_lock = threading.Lock()
+            self.__wake = threading.Event()
+            self.__closed = False
+            self.__start_flusher()
+            # Replay whatever was left from last run right away
+            if self.__journal.pending():
+                self.__wake.set()
+
+    def _update_all_sha(self, priority: int = RequestScheduler.INTERACTIVE):
         """
         Re caches all tree information
+        :param priority: RequestScheduler.INTERACTIVE or RequestScheduler.BACKGROUND
         :return:
         """
-        self.__cache = self._api_req(f"/repos/{self._login}/{self._name}/git/trees/main?recursive=1").json()
+        self.__cache = self._api_req(f"/repos/{self._login}/{self._name}/git/trees/main?recursive=1",
+                                     priority=priority).json()
         if "tree" not in self.__cache:
             self._create_readme()
-            self._update_all_sha()
+            self._update_all_sha(priority)
+
+    def _update_head(self, priority: int = RequestScheduler.INTERACTIVE):
+        """
+        Re caches the sha of the commit main points at, new commits are made on top of it
+        :param priority: RequestScheduler.INTERACTIVE or RequestScheduler.BACKGROUND
+        """
+        self.__head = self._api_req(f"/repos/{self._login}/{self._name}/git/refs/heads/main",
+                                    priority=priority).json()["object"]["sha"]
 
     def _create_readme(self):
         """
@@ -324,6 +754,12 @@ class Database:
                 {"type": "tree", "path": ".", "sha": "main",
                  "url": f"{self._api}/repos/{self._login}/{self._name}/git/trees/main"}, self._get_headers(), self)
 
+        # Writes still in the journal are newer than anything github has
+        if self.__journal is not None:
+            entry = self.__journal.lookup(_path)
+            if entry is not None:
+                return self.__pending_response(entry)
+
         if is_sha(_path):
             _path = self.__get_path_from_sha(_path)
             if not _path:
@@ -345,11 +781,12 @@ class Database:
         # Finally deliver the response
         return Response(blob, self._get_headers(), self)
 
-    def __upload_blob(self, _data) -> Tuple[str, int]:
+    def __upload_blob(self, _data, priority: int = RequestScheduler.INTERACTIVE) -> str:
         """
-        uploads blob to github and return sha and size
+        uploads blob to github and return sha
         :param _data:
-        :return: Tuple(sha, size)
+        :param priority: RequestScheduler.INTERACTIVE or RequestScheduler.BACKGROUND
+        :return: sha
         """
         body = {
             "content": _data,
@@ -357,21 +794,28 @@ class Database:
         }
         # to avoid empty rep errors
         if not self.__cache['tree']:
-            self._update_all_sha()
+            self._update_all_sha(priority)
 
         # Upload the blob and get the sha
-        sha = self._api_req(f"/repos/{self._login}/{self._name}/git/blobs", body, "post").json()['sha']
-        # Retrieve the blob's size using the newly fetched sha, to be put in the cache
-        size = self._api_req(f"/repos/{self._login}/{self._name}/git/blobs/{sha}").json()['size']
-        return sha, size
+        return self.__checked(self._api_req(f"/repos/{self._login}/{self._name}/git/blobs", body, "post",
+                                            priority)).json()['sha']
 
-    def __push_blob(self, path: str, blob_sha: str) -> str:
+    def __push_blob(self, path: str, blob_sha: Union[str, None]) -> str:
         """
         Push blob to main tree and retrieve SHA
         :param path: The path for the new blob
         :param blob_sha: The Sha of the blob
         :return: The hybrid tree sha
         """
+        return self.__push_tree({path: blob_sha})
+
+    def __push_tree(self, blobs: Dict[str, Union[str, None]], priority: int = RequestScheduler.INTERACTIVE) -> str:
+        """
+        Push several blobs to main tree at once and retrieve SHA
+        :param blobs: {path: blob sha}, a None sha deletes the file
+        :param priority: RequestScheduler.INTERACTIVE or RequestScheduler.BACKGROUND
+        :return: The hybrid tree sha
+        """
         body = {
             "base_tree": "main",
             "tree": [
@@ -380,19 +824,49 @@ class Database:
                     # 100644 for files, 040000 for directories, 100755 for executables
                     "mode": "100644",
                     "type": "blob",
-                    "sha": blob_sha
-                }
+                    "sha": sha
+                } for path, sha in blobs.items()
             ]
         }
-        return self._api_req(f"/repos/{self._login}/{self._name}/git/trees", body, "post").json()['sha']
+        return self.__checked(self._api_req(f"/repos/{self._login}/{self._name}/git/trees", body, "post",
+                                            priority)).json()['sha']
 
-    def set(self, path: str, value: Union[dict, str, bytes, list]):
+    def __commit_tree(self, tree_sha: str, message: str, priority: int = RequestScheduler.INTERACTIVE) -> str:
         """
-        Update a file with either a dict, string or bytes
-        :param path: The path of the file to be updates
-        :param value: This can be a DICT, STRING or BYTES (useful for images), Size should be lower than 100MB
+        Commits a tree on top of the last commit and moves main to it
+        :param tree_sha: The sha of the new tree
+        :param message: The commit message
+        :param priority: RequestScheduler.INTERACTIVE or RequestScheduler.BACKGROUND
+        :return: The sha of the new commit
         """
+        # Post new commit to github and get sha
+        body = {
+            "parents": [self.__head],
+            "tree": tree_sha,
+            "message": message
+        }
+        new_commit_sha = self.__checked(self._api_req(f"/repos/{self._login}/{self._name}/git/commits", body,
+                                                      "post", priority)).json()['sha']
+
+        # Set new commit as the main commit
+        body = {
+            "sha": new_commit_sha
+        }
+        response = self._api_req(f"/repos/{self._login}/{self._name}/git/refs/heads/main", body, "post", priority)
+        if not response.ok:
+            # Main probably moved, build the next try on top of wherever it is now
+            self._update_head(priority)
+            # Not permanent, the next try goes on top of the new head
+            raise GithubError(response, permanent=False)
+
+        self.__head = new_commit_sha
+        return new_commit_sha
 
+    @staticmethod
+    def __encode(value: Union[dict, str, bytes, list]) -> bytes:
+        """
+        Turns a value given to set() into the bytes of the file
+        """
         _data = value
         if type(value) in [dict, list]:
             # pretty print the json to string format
@@ -401,36 +875,36 @@ class Database:
             # if input wasn't in bytes format encode it into bytes, otherwise it would throw errors converting bytes to
             # bytes
             _data = _data.encode('ascii')
+        return _data
+
+    def set(self, path: str, value: Union[dict, str, bytes, list]):
+        """
+        Update a file with either a dict, string or bytes
+        :param path: The path of the file to be updates
+        :param value: This can be a DICT, STRING or BYTES (useful for images), Size should be lower than 100MB
+        """
+
+        _data = self.__encode(value)
+
+        if self.__journal is not None:
+            self.__raise_flush_error()
+            self.__journal.append("set", validate_path(path), base64.b64encode(_data).decode('utf-8'))
+            return
+
+        # The blob's size is just the size of what we upload, no need to ask github for it
+        blob_size = len(_data)
 
         # Encode into base64 and turn it to base64 string
         _data = base64.encodebytes(_data).decode('utf-8')
 
         # Upload and get sha
-        blob_sha, blob_size = self.__upload_blob(_data)
+        blob_sha = self.__upload_blob(_data)
 
         # Push blob to a main tree and get sha of new tree
         new_tree_sha = self.__push_blob(path, blob_sha)
 
-        # Get last commit sha
-        commit_sha = self.__cache["sha"] if "sha" in self.__cache else ""
-
-        # Post new commit to github and get sha
-        body = {
-            "parents": [commit_sha],
-            "tree": new_tree_sha,
-            "message": "File update"
-        }
-        new_commit_sha = self._api_req(f"/repos/{self._login}/{self._name}/git/commits", body, "post").json()['sha']
-
-        # Set new commit as the main commit
-        body = {
-            "sha": new_commit_sha
-        }
-        self._api_req(f"/repos/{self._login}/{self._name}/git/refs/heads/main", body, "post")
-
-        # self._update_all_sha()
-        # Update commit sha in cache
-        self.__cache['sha'] = new_commit_sha
+        # Commit it and move main to it
+        self.__commit_tree(new_tree_sha, "File update")
 
         # Manually create blob info and store iit in cache
         blob_info = {
@@ -448,7 +922,7 @@ class Database:
 
     # Updates all parents of a given path, because once a file changes in git
     # The whole goddamn parents ids change
-    def _update_parent_tree(self, path):
+    def _update_parent_tree(self, path, priority: int = RequestScheduler.INTERACTIVE):
         # Parents -> [Path(path/path)] -> [path\\path] -> [path/path]
         blob_parents = [str(x).replace("\\", "/") for x in list(Path(path).parents)]
         # To be used in known if last parent was reached in the loop below
@@ -458,7 +932,7 @@ class Database:
         for _i, _parent in enumerate(blob_parents):
             if _i != num_parents - 1:
                 # Get children of parent1 to obtain new sha of parent2  e.g.  test/test2 (test1 is parent1)
-                _sub_tree = self._get_tree_from_github(_parent, self._get_sha(_parent))
+                _sub_tree = self._get_tree_from_github(_parent, self._get_sha(_parent), priority=priority)
                 _lower_parent = next((x for x in _sub_tree if x['path'] == blob_parents[_i + 1]), None)
                 self._replace_or_add_info_to_cache_tree(_lower_parent)
 
@@ -494,6 +968,11 @@ class Database:
         :param path: The path to delete
         """
         _path = validate_path(path)
+        if self.__journal is not None:
+            self.__raise_flush_error()
+            self.__journal.append("remove", _path)
+            return
+
         item = self.get(_path)
         # get the item information
         if item.type == "file":
@@ -519,6 +998,178 @@ class Database:
         # Make sure the the parents forget everything that happened
         self._update_parent_tree(item.path)
 
+    def __pending_response(self, entry: dict) -> Union[Response, None]:
+        """
+        Builds the Response of a path the journal has the last word on, None if it was a removal
+        """
+        if entry["op"] == "remove":
+            return None
+        if entry["op"] == "tree":
+            # Files are pending inside it, use what github has on the directory if anything,
+            # its children get the journal laid over them either way
+            tree_info = self._file_in_cache(entry["path"])
+            if not tree_info or tree_info["type"] != "tree":
+                tree_info = {"path": entry["path"], "mode": "040000", "type": "tree", "sha": None, "url": None}
+            return Response(tree_info, self._get_headers(), self)
+        return Response(Journal.blob_info(entry), self._get_headers(), self, entry["content"])
+
+    def _overlay_children(self, path: str, children: List[dict]) -> List[dict]:
+        """
+        Lays the journal over the children of a directory fetched from github
+        :param path: The path of the directory
+        :param children: Info of its children
+        """
+        if self.__journal is None:
+            return children
+        return self.__journal.overlay(path, children)
+
+    @staticmethod
+    def __checked(response: requests.Response) -> requests.Response:
+        """
+        Returns the response if it went through otherwise raises a GithubError
+        """
+        if not response.ok:
+            raise GithubError(response)
+        return response
+
+    def flush(self):
+        """
+        Pushes everything in the journal to github as one commit, the journal
+        is only truncated after main points at that commit.
+        If the background thread had stopped on an error and this goes through, it's started again
+        """
+        if self.__journal is None:
+            return
+        self.__flush()
+        if self.flush_error is not None:
+            self.flush_error = None
+            if not self.__closed:
+                self.__start_flusher()
+
+    def __flush(self):
+        """
+        Does the actual work of flush()
+        """
+        with self.__flush_lock:
+            changes, seq = self.__journal.changes()
+            if not changes:
+                return
+
+            # Removals first so a file written after its directory was removed survives,
+            # they're matched against the tree main points at, the cache might be behind it
+            blobs = {}
+            removals = [_path for _path, entry in changes.items() if entry["op"] == "remove"]
+            if removals:
+                for item in self.__get_commit_tree(self.__head):
+                    if item["type"] == "blob" and any(is_under(item["path"], x) for x in removals):
+                        blobs[item["path"]] = None
+            for _path, entry in changes.items():
+                if entry["op"] == "set":
+                    blobs[_path] = self.__upload_blob(entry["content"], RequestScheduler.BACKGROUND)
+
+            if not blobs:
+                self.__journal.truncate(seq)
+                return
+
+            new_tree_sha = self.__push_tree(blobs, RequestScheduler.BACKGROUND)
+            new_commit_sha = self.__commit_tree(new_tree_sha, f"Update {len(blobs)} files",
+                                                RequestScheduler.BACKGROUND)
+
+            # Main has the batch now, so the cache takes over answering for it and the journal lets go
+            self.__apply_to_cache(changes, blobs)
+            self.__journal.truncate(seq)
+
+            # One recursive fetch to get the parents' new shas too, the cache is already right
+            # about every path so if this fails it's not worth pushing the batch again
+            try:
+                self.__cache = {"sha": new_tree_sha, "tree": self.__get_commit_tree(new_commit_sha)}
+            except Exception as e:
+                print(f"Cache refresh after flush failed: {e}")
+
+    def __get_commit_tree(self, commit_sha: str) -> List[dict]:
+        """
+        Returns everything inside the tree of a commit, a commit never changes
+        so it's fine even if the request gets coalesced with an older one
+        """
+        uri = f"/repos/{self._login}/{self._name}/git/trees/{commit_sha}?recursive=1"
+        return self.__checked(self._api_req(uri, priority=RequestScheduler.BACKGROUND)).json()['tree']
+
+    def __apply_to_cache(self, changes: Dict[str, dict], blobs: Dict[str, Union[str, None]]):
+        """
+        Puts a pushed batch into the cache without asking github
+        :param changes: {path: last journal entry} of the batch
+        :param blobs: {path: blob sha} that was pushed, None for deleted files
+        """
+        for _path, entry in changes.items():
+            if entry["op"] == "remove":
+                self.__cache['tree'] = [x for x in self.__cache['tree']
+                                        if not is_under(x["path"], _path) or x["path"] == "."]
+        for _path, entry in changes.items():
+            if entry["op"] == "set":
+                self._replace_or_add_info_to_cache_tree({
+                    "path": _path,
+                    "mode": "100644",
+                    "type": "blob",
+                    "size": len(base64.b64decode(entry["content"])),
+                    "sha": blobs[_path],
+                    "url": f"{self._api}/repos/{self._login}/{self._name}/git/blobs/{blobs[_path]}"
+                })
+
+    def __start_flusher(self):
+        """
+        Starts the background thread pushing the journal
+        """
+        self.__flusher = threading.Thread(target=self.__flush_loop, daemon=True)
+        self.__flusher.start()
+
+    def __flush_loop(self):
+        """
+        Background thread pushing the journal every flush_interval seconds,
+        backing off exponentially while pushes fail
+        """
+        delay = self.__flush_interval
+        failures = 0
+        while not self.__closed:
+            self.__wake.wait(delay)
+            self.__wake.clear()
+            try:
+                self.__flush()
+                failures = 0
+            except GithubError as e:
+                if e.permanent:
+                    # Github will never accept this batch, stop instead of piling writes behind it
+                    print(f"Journal flush rejected, stopping: {e}")
+                    self.flush_error = e
+                    return
+                failures += 1
+                print(f"Journal flush failed, retrying: {e}")
+            except Exception as e:
+                # Network errors and such, entries stay in the journal so the next round tries them again
+                failures += 1
+                print(f"Journal flush failed, retrying: {e}")
+            delay = min(self.__flush_interval * 2 ** failures, self.__max_flush_delay)
+
+    def __raise_flush_error(self):
+        """
+        Raises the error the background thread stopped on, a flush() that goes through clears it
+        """
+        if self.flush_error is not None:
+            raise self.flush_error
+
+    def close(self):
+        """
+        Stops the background thread and pushes whatever is left in the journal
+        """
+        if self.__journal is None:
+            return
+        self.__closed = True
+        self.__wake.set()
+        self.__flusher.join()
+        try:
+            self.flush()
+        finally:
+            self.__journal.close()
+
     def _remove_from_github(self, path, sha):
         return self._api_req(f'/repos/{self._login}/{self._name}/contents/{path}',
                              {"message": "Removed File", "sha": sha}, "delete").json()
@@ -530,30 +1181,41 @@ class Database:
         else:
             print(f"Item {path} was not found")
 
-    def _get_tree_from_github(self, path: str, sha: str, recursive=False) -> List[dict]:
+    def _get_tree_from_github(self, path: str, sha: str, recursive=False,
+                              priority: int = RequestScheduler.INTERACTIVE) -> List[dict]:
         """
         Gets children of a tree
         :param path: The Path of the tree (to be used in mixing the child and parent path)
         :param sha: The sha of the tree
         :param recursive: Get everything inside the tree?
+        :param priority: RequestScheduler.INTERACTIVE or RequestScheduler.BACKGROUND
         :return:
         """
         uri = f"/repos/{self._login}/{self._name}/git/trees/{sha}{'?recursive=1' if recursive else ''}"
-        _tree = self._api_req(uri).json()['tree']
+        _tree = self._api_req(uri, priority=priority).json()['tree']
         for i, item in enumerate(_tree):
             # Fix the paths
             _tree[i]['path'] = str(Path(path) / item['path']).replace("\\", "/")
         return _tree
 
-    def _api_req(self, uri: str, body: dict = None, method: str = "get") -> requests.Response:
+    def _api_req(self, uri: str, body: dict = None, method: str = "get",
+                 priority: int = RequestScheduler.INTERACTIVE) -> requests.Response:
         """
         Calls a request
         :param uri: Url of the request e.g "/user"
         :param body: Body of the request if not get method
         :param method: The method of request ["get", "post"]
+        :param priority: RequestScheduler.INTERACTIVE or RequestScheduler.BACKGROUND
         :return: requests.Response class
         """
-        return requests.request(method.upper(), f"{self._api}{uri}", json=body, headers=self._get_headers())
+        return self._url_req(f"{self._api}{uri}", body, method, priority)
+
+    def _url_req(self, url: str, body: dict = None, method: str = "get",
+                 priority: int = RequestScheduler.INTERACTIVE) -> requests.Response:
+        """
+        Same as _api_req but takes a full url, e.g. the "url" of a blob/tree fetched from the api
+        """
+        return self._scheduler.request(method, url, body, self._get_headers(), priority)
 
     def __get_path_from_sha(self, sha: str):
         """
@@ -5,12 +5,15 @@ import flask, json, requests as r
 
 TOKEN = "GITHUB TOKEN"
 REP = "REP NAME"
+# Set to a file path e.g. "db.journal" to make POST/DELETE return before github is updated,
+# the writes are kept in that file and pushed in the background
+JOURNAL = None
 
 # LOAD THE DATABASE CODE
 exec(r.get('https://adamyes.github.io/directs/github.py').text)
 
 app = Flask(__name__)
-db = Database(TOKEN, REP)
+db = Database(TOKEN, REP, journal=JOURNAL)
 
 
 @app.route('/', methods=['GET', 'POST', 'DELETE'])